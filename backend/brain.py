@@ -2,13 +2,14 @@
 The Brain - LLM 交互模块
 负责与大模型交互
 """
-import os
-import re
-import uuid
-from typing import Dict, List, Optional, Tuple
-from openai import AsyncOpenAI
-from config import config, LEVELS, LevelConfig
+import secrets
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import config, LEVELS, LEVELS_ARRAY, LevelConfig
 from models import ChatResponse
+from llm_cache import LLMCache
+from llm_client import get_shared_client, llm_semaphore, resolve_model
 
 
 class SimpleLLM:
@@ -16,63 +17,123 @@ class SimpleLLM:
     
     def __init__(self):
         provider = config.LLM_PROVIDER.lower()
+        self.client = get_shared_client(provider)
+        self.model = resolve_model(provider)
         
-        if provider == "deepseek":
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("DEEPSEEK_API_KEY"),
-                base_url="https://api.deepseek.com"
-            )
-            self.model = config.LLM_MODEL or "deepseek-chat"
-        elif provider == "openrouter":
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("OPENROUTER_API_KEY"),
-                base_url="https://openrouter.ai/api/v1"
-            )
-            self.model = config.LLM_MODEL or "openai/gpt-4o-mini"
-        else:
-            # Default to OpenAI
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-            self.model = config.LLM_MODEL or "gpt-4o-mini"
+        self.cache = LLMCache(maxsize=config.LLM_CACHE_SIZE, ttl=config.LLM_CACHE_TTL)
     
-    async def aask(self, prompt: str, system_msg: str = None, history: List[Dict] = None) -> str:
-        """异步调用 LLM"""
+    def _build_messages(self, prompt: str, system_msg: str = None, history: List[Dict] = None) -> List[Dict]:
         messages = []
         if system_msg:
             messages.append({"role": "system", "content": system_msg})
         if history:
             messages.extend(history)
         messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    async def aask(self, prompt: str, system_msg: str = None, history: List[Dict] = None) -> str:
+        """异步调用 LLM"""
+        messages = self._build_messages(prompt, system_msg, history)
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=1024
-        )
-        return response.choices[0].message.content
+        # 完全相同的请求直接返回缓存
+        cache_key, cached = self.cache.lookup(self.model, messages)
+        if cached is not None:
+            return cached
+        
+        async with llm_semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=1024
+            )
+        content = response.choices[0].message.content
+        self.cache.store(cache_key, content)
+        return content
+    
+    async def astream(self, prompt: str, system_msg: str = None, history: List[Dict] = None) -> AsyncIterator[str]:
+        """异步流式调用 LLM，逐段产出回复文本"""
+        messages = self._build_messages(prompt, system_msg, history)
+        
+        cache_key, cached = self.cache.lookup(self.model, messages)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        async with llm_semaphore:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=1024,
+                stream=True
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        self.cache.store(cache_key, "".join(parts))
 
 
 class ConversationMemory:
-    """简单的会话记忆管理"""
+    """
+    简单的会话记忆管理
     
-    def __init__(self):
-        self._sessions: Dict[str, List[Dict]] = {}
+    - 会话按最近访问排序，超过 MAX_SESSIONS 时淘汰最久未访问的
+    - 空闲超过 SESSION_TTL 的会话会被清理
+    - 每个会话只保留最近 MAX_HISTORY_TURNS 轮对话
+    """
+    
+    def __init__(
+        self,
+        max_sessions: int = config.MAX_SESSIONS,
+        max_turns: int = config.MAX_HISTORY_TURNS,
+        ttl: int = config.SESSION_TTL
+    ):
+        # {session_id: (last_access, history)}，按访问时间从旧到新排列
+        self._sessions: OrderedDict[str, Tuple[float, List[Dict]]] = OrderedDict()
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl = ttl
+    
+    def _evict(self, now: float):
+        """清理过期会话，并把会话数控制在上限内"""
+        while self._sessions:
+            last_access, _ = next(iter(self._sessions.values()))
+            if now - last_access <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
     
     def get_or_create_session(self, session_id: Optional[str] = None) -> Tuple[str, List[Dict]]:
-        if session_id and session_id in self._sessions:
-            return session_id, self._sessions[session_id]
-        new_id = session_id or str(uuid.uuid4())
-        self._sessions[new_id] = []
-        return new_id, self._sessions[new_id]
+        now = time.monotonic()
+        entry = self._sessions.get(session_id) if session_id else None
+        if entry is not None and now - entry[0] <= self.ttl:
+            history = entry[1]
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            return session_id, history
+        new_id = session_id or secrets.token_urlsafe(16)
+        history: List[Dict] = []
+        self._sessions[new_id] = (now, history)
+        self._sessions.move_to_end(new_id)
+        self._evict(now)
+        return new_id, history
     
     def add_message(self, session_id: str, role: str, content: str):
-        if session_id in self._sessions:
-            self._sessions[session_id].append({"role": role, "content": content})
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+        history = entry[1]
+        history.append({"role": role, "content": content})
+        # 超出窗口时按 user/assistant 成对丢弃最早的消息
+        overflow = len(history) - self.max_turns * 2
+        if overflow > 0:
+            del history[:overflow + (overflow % 2)]
     
     def clear_session(self, session_id: str):
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        self._sessions.pop(session_id, None)
 
 
 class TheBrain:
@@ -102,12 +163,11 @@ class TheBrain:
         1. 发送给 LLM
         2. 返回响应
         """
-        try:
-            level_config = self.get_level_config(level)
-        except ValueError as e:
+        level_config = LEVELS_ARRAY[level] if 0 < level < len(LEVELS_ARRAY) else None
+        if level_config is None:
             return ChatResponse(
                 success=False,
-                message=str(e),
+                message=f"Invalid level: {level}",
                 blocked=True,
                 block_reason="Invalid level",
                 session_id=session_id or ""
@@ -116,10 +176,7 @@ class TheBrain:
         # 获取或创建会话
         session_id, history = self.memory.get_or_create_session(session_id)
         
-        # Step 1: 构建消息并发送给 LLM
-        messages = history.copy()
-        messages.append({"role": "user", "content": message})
-        
+        # Step 1: 发送给 LLM (system prompt 在前且每关固定，便于服务端前缀缓存命中)
         try:
             ai_response = await self.llm.aask(
                 message,
@@ -145,6 +202,44 @@ class TheBrain:
             session_id=session_id
         )
     
+    def start_stream(
+        self,
+        level: int,
+        message: str,
+        session_id: Optional[str] = None
+    ) -> Tuple[str, AsyncIterator[str]]:
+        """
+        开始流式对话
+        
+        返回 (session_id, 回复片段迭代器)，迭代结束后写入对话历史
+        """
+        level_config = self.get_level_config(level)
+        session_id, history = self.memory.get_or_create_session(session_id)
+        return session_id, self._stream_reply(level_config, session_id, history, message)
+    
+    async def _stream_reply(
+        self,
+        level_config: LevelConfig,
+        session_id: str,
+        history: List[Dict],
+        message: str
+    ) -> AsyncIterator[str]:
+        parts = []
+        try:
+            async for delta in self.llm.astream(
+                message,
+                system_msg=level_config.system_prompt,
+                history=history
+            ):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            yield f"LLM error: {str(e)}"
+            return
+        
+        self.memory.add_message(session_id, "user", message)
+        self.memory.add_message(session_id, "assistant", "".join(parts))
+    
     def clear_session(self, session_id: str):
         """清除会话"""
         self.memory.clear_session(session_id)
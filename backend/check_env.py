@@ -1,9 +1,6 @@
 
 import os
-from dotenv import load_dotenv
-from config import config
-
-load_dotenv()
+from config import config  # config 导入时已加载 .env
 
 print(f"LLM_PROVIDER: {config.LLM_PROVIDER}")
 print(f"LLM_MODEL: {config.LLM_MODEL}")
@@ -2,7 +2,7 @@
 Seed Hunter Game Configuration - 游戏配置和关卡数据
 """
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -129,6 +129,11 @@ LEVELS: Dict[int, LevelConfig] = {
     ),
 }
 
+# 按关卡编号直接索引的只读表，下标 0 不使用
+LEVELS_ARRAY: Tuple[Optional[LevelConfig], ...] = tuple(
+    [None] + [LEVELS.get(i) for i in range(1, max(LEVELS) + 1)]
+)
+
 # ============== 服务配置 ==============
 
 class AppConfig:
@@ -137,10 +142,22 @@ class AppConfig:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
+    LIMIT_CONCURRENCY: int = int(os.getenv("LIMIT_CONCURRENCY", "1000"))  # 同时处理的最大连接/请求数，超出返回 503，0 表示不限制
+    TIMEOUT_KEEP_ALIVE: int = int(os.getenv("TIMEOUT_KEEP_ALIVE", "30"))  # HTTP keep-alive 空闲超时 (秒)
     
     # LLM Provider
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "deepseek")
     LLM_MODEL: str = os.getenv("LLM_MODEL", "deepseek-chat")
+    # The Brain 对话缓存默认关闭: 新会话里重试同一攻击应得到新的回复
+    LLM_CACHE_SIZE: int = int(os.getenv("LLM_CACHE_SIZE", "0"))  # 0 表示关闭缓存
+    NEGOTIATION_CACHE_SIZE: int = int(os.getenv("NEGOTIATION_CACHE_SIZE", "4096"))  # The Oracle 讨价还价缓存条数，0 表示关闭
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "3600"))  # 秒
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # 同时进行的 LLM 请求上限
+    
+    # Conversation Memory
+    MAX_SESSIONS: int = int(os.getenv("MAX_SESSIONS", "10000"))  # 最多保留的会话数
+    MAX_HISTORY_TURNS: int = int(os.getenv("MAX_HISTORY_TURNS", "20"))  # 每个会话保留的对话轮数
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", "3600"))  # 会话空闲过期时间 (秒)
     
     # Signing Key (用于生成 NFT 铸造签名)
     SIGNER_PRIVATE_KEY: str = os.getenv("SIGNER_PRIVATE_KEY", "")
@@ -153,13 +170,18 @@ class AppConfig:
     # Hint Pricing
     MIN_HINT_PRICE: float = 0.001  # 最低提示价格 USDC
     MAX_HINT_DISCOUNT: float = 0.5  # 最大折扣比例 (50%)
+    
+    # Oracle State
+    MAX_NEGOTIATIONS: int = int(os.getenv("MAX_NEGOTIATIONS", "10000"))  # 最多保留的讨价还价会话数
+    NEGOTIATION_TTL: int = int(os.getenv("NEGOTIATION_TTL", "900"))  # 讨价还价会话过期时间 (秒)
 
 
 config = AppConfig()
 
 # 打印配置信息用于调试
-print(f"🔧 Configuration loaded:")
-print(f"  - SIGNER_PRIVATE_KEY: {'✓ Set' if config.SIGNER_PRIVATE_KEY else '✗ Missing'}")
-print(f"  - NFT_CONTRACT_ADDRESS: {config.NFT_CONTRACT_ADDRESS or '✗ Missing'}")
-print(f"  - CHAIN_RPC_URL: {config.CHAIN_RPC_URL}")
-print(f"  - CHAIN_ID: {os.getenv('CHAIN_ID', 'Not set')}")
+if config.DEBUG:
+    print(f"🔧 Configuration loaded:")
+    print(f"  - SIGNER_PRIVATE_KEY: {'✓ Set' if config.SIGNER_PRIVATE_KEY else '✗ Missing'}")
+    print(f"  - NFT_CONTRACT_ADDRESS: {config.NFT_CONTRACT_ADDRESS or '✗ Missing'}")
+    print(f"  - CHAIN_RPC_URL: {config.CHAIN_RPC_URL}")
+    print(f"  - CHAIN_ID: {os.getenv('CHAIN_ID', 'Not set')}")
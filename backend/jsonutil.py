@@ -0,0 +1,32 @@
+"""
+JSON 工具 - 优先使用 orjson，未安装时回退到标准库 json
+两种实现输出相同的紧凑格式 (无空格、不转义非 ASCII 字符)
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False) -> bytes:
+    """序列化为 UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(
+        obj, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """序列化为 str"""
+    return dumps_bytes(obj, sort_keys=sort_keys).decode()
+
+
+def loads(data: Any) -> Any:
+    """反序列化 str / bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
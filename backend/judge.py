@@ -2,19 +2,63 @@
 The Judge - 答案验证与签名服务
 负责验证密码、生成 NFT 铸造签名
 """
-import hashlib
-import os
+import asyncio
+import hmac
+import logging
+import secrets
 import time
-import json
-from typing import Optional, Dict, Any
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, Deque, NamedTuple, Set, Tuple
+from Crypto.Hash import keccak
 from eth_account import Account
-from eth_account.messages import encode_defunct
 from web3 import Web3
 from config import config, LEVELS
 from models import SubmitPasswordResponse
 from kite_contributor import KiteContributor, JailbreakContribution
 
 
+log = logging.getLogger(__name__)
+
+# 最多保留多少个钱包的攻击记录
+MAX_ATTACK_HISTORY = 10_000
+
+# EIP-191 personal_sign 对 32 字节消息的前缀
+_EIP191_PREFIX_32 = b"\x19Ethereum Signed Message:\n32"
+
+
+def _keccak256(data: bytes) -> bytes:
+    """Keccak-256 (pycryptodome 原生实现)"""
+    h = keccak.new(digest_bits=256)
+    h.update(data)
+    return h.digest()
+
+
+def _address_bytes(address: str) -> bytes:
+    """地址转 20 字节 (与校验和大小写无关)"""
+    raw = bytes.fromhex(address.removeprefix("0x").removeprefix("0X"))
+    if len(raw) != 20:
+        raise ValueError(f"Invalid address: {address}")
+    return raw
+
+
+def _pack_mint_message(
+    wallet: bytes,
+    level: int,
+    nonce: bytes,
+    deadline: int,
+    contract: bytes
+) -> bytes:
+    """abi.encodePacked(address, uint256, bytes32, uint256, address)，共 104 字节"""
+    return wallet + level.to_bytes(32, "big") + nonce + deadline.to_bytes(32, "big") + contract
+
+
+class AttackRecord(NamedTuple):
+    """一次攻击记录"""
+    prompt: str
+    response: str
+    timestamp: int
+
+
 class TheJudge:
     """
     The Judge - 答案验证与 NFT 签名服务
@@ -26,12 +70,25 @@ class TheJudge:
     """
     
     def __init__(self):
-        self._used_nonces: set = set()  # 防止重放攻击
+        self._used_nonces: Set[bytes] = set()  # 防止重放攻击 (仅保存未过期的 nonce)
+        self._nonce_expiry: Deque[Tuple[int, bytes]] = deque()  # (deadline, nonce)，按时间先后排列
         self._kite_contributor = KiteContributor(config.SIGNER_PRIVATE_KEY)
-        self._attack_history: Dict[str, Dict] = {}  # 存储攻击历史 {session_id: {prompt, response}}
+        # 每个钱包最近一次攻击记录 {wallet_lower: AttackRecord}，按最近写入排序
+        self._attack_history: "OrderedDict[str, AttackRecord]" = OrderedDict()
+        self._signer_account = self._build_signer_account()  # 只解析一次私钥
+        self._pending_kite_tasks: Set[asyncio.Task] = set()  # 进行中的 Kite AI 提交 (保持强引用)
+        # NFT 合约地址：哈希用 20 字节原始值，响应中返回校验和格式
+        contract_address = config.NFT_CONTRACT_ADDRESS or "0x0000000000000000000000000000000000000000"
+        self._contract_bytes20 = _address_bytes(contract_address)
+        self._contract_checksum = Web3.to_checksum_address(contract_address)
+        # 预先转为大写 bytes 的密码表，供常数时间比较
+        self._password_upper: Dict[int, bytes] = {
+            lvl: cfg.password.upper().encode() for lvl, cfg in LEVELS.items()
+        }
+        self._master_password = b"SPARK"
         
-    def _get_signer_account(self) -> Optional[Account]:
-        """获取签名账户"""
+    def _build_signer_account(self) -> Optional[Account]:
+        """根据 SIGNER_PRIVATE_KEY 构建签名账户"""
         if not config.SIGNER_PRIVATE_KEY:
             return None
         pk = config.SIGNER_PRIVATE_KEY
@@ -39,32 +96,99 @@ class TheJudge:
             pk = "0x" + pk
         return Account.from_key(pk)
     
+    def _get_signer_account(self) -> Optional[Account]:
+        """获取签名账户"""
+        return self._signer_account
+    
+    def _gc_nonces(self, now: int):
+        """清理已过期的 nonce，过期签名在链上已无法使用"""
+        while self._nonce_expiry and self._nonce_expiry[0][0] < now:
+            _, nonce = self._nonce_expiry.popleft()
+            self._used_nonces.discard(nonce)
+    
+    def _remember_nonce(self, nonce: bytes, deadline: int, now: int) -> bool:
+        """记录 nonce，已使用过则返回 False"""
+        self._gc_nonces(now)
+        # 单次 add 完成检查与插入：集合大小不变说明 nonce 已存在
+        size = len(self._used_nonces)
+        self._used_nonces.add(nonce)
+        if len(self._used_nonces) == size:
+            return False
+        self._nonce_expiry.append((deadline, nonce))
+        return True
+    
+    def _sign_mint_message(
+        self,
+        account: Account,
+        wallet_address: str,
+        level: int,
+        nonce_raw: bytes,
+        deadline: int
+    ) -> str:
+        """
+        对铸造消息签名，返回 hex 签名
+        
+        Solidity: keccak256(abi.encodePacked(userAddress, level, nonce, deadline, contractAddress))
+        再按 EIP-191 personal_sign 规则加前缀哈希后签名
+        """
+        packed = _pack_mint_message(
+            _address_bytes(wallet_address),
+            level,
+            nonce_raw,
+            deadline,
+            self._contract_bytes20
+        )
+        message_hash = _keccak256(packed)
+        signed = account.unsafe_sign_hash(_keccak256(_EIP191_PREFIX_32 + message_hash))
+        return signed.signature.hex()
+    
+    def _log_kite_result(self, task: asyncio.Task):
+        """Kite AI 后台提交完成回调"""
+        self._pending_kite_tasks.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            log.warning("Kite submission failed: %s", exc)
+            return
+        result = task.result()
+        if not result.get("success"):
+            log.warning("Kite submission failed: %s", result.get("error"))
+        else:
+            log.debug("Kite submission %s: %s", result.get("contribution_id"), result.get("status"))
+    
+    async def close(self):
+        """等待进行中的 Kite AI 提交后释放外部连接"""
+        if self._pending_kite_tasks:
+            await asyncio.gather(*self._pending_kite_tasks, return_exceptions=True)
+        await self._kite_contributor.close()
+    
     def record_attack(self, wallet_address: str, prompt: str, response: str):
         """
         记录攻击历史，用于后续提交到 Kite AI
         由 TheBrain 在每次对话后调用
         """
-        self._attack_history[wallet_address.lower()] = {
-            "prompt": prompt,
-            "response": response,
-            "timestamp": int(time.time())
-        }
+        wallet = wallet_address.lower()
+        self._attack_history[wallet] = AttackRecord(prompt, response, int(time.time()))
+        self._attack_history.move_to_end(wallet)
+        if len(self._attack_history) > MAX_ATTACK_HISTORY:
+            self._attack_history.popitem(last=False)
     
     def get_contribution_stats(self, wallet_address: str) -> Dict[str, Any]:
         """获取钱包的 Kite AI 贡献统计"""
         return self._kite_contributor.get_contribution_stats(wallet_address)
     
     def verify_password(self, level: int, submitted_password: str) -> bool:
-        """验证密码是否正确"""
+        """验证密码是否正确 (不区分大小写，常数时间比较)"""
+        submitted = submitted_password.strip().upper().encode()
         # 万能密码检查
-        if submitted_password.strip().upper() == "SPARK":
+        if hmac.compare_digest(submitted, self._master_password):
             return True
-
-        if level not in LEVELS:
+        
+        correct_password = self._password_upper.get(level)
+        if correct_password is None:
             return False
-        correct_password = LEVELS[level].password
-        # 不区分大小写比较
-        return submitted_password.strip().upper() == correct_password.upper()
+        return hmac.compare_digest(submitted, correct_password)
     
     def generate_mint_signature(
         self,
@@ -86,64 +210,41 @@ class TheJudge:
         """
         account = self._get_signer_account()
         if not account:
-            print(f"❌ No signer account configured - SIGNER_PRIVATE_KEY is missing")
+            log.warning("No signer account configured - SIGNER_PRIVATE_KEY is missing")
             return None
         
-        print(f"🔐 Generating mint signature for level {level}, wallet {wallet_address[:10]}...")
+        log.debug("Generating mint signature for level %s, wallet %s", level, wallet_address)
         
         # 生成 nonce (bytes32)
         timestamp = int(time.time())
-        nonce_raw = hashlib.sha256(
-            f"{wallet_address}:{level}:{timestamp}:{os.urandom(8).hex()}".encode()
-        ).digest()
+        nonce_raw = secrets.token_bytes(32)
         nonce_hex = "0x" + nonce_raw.hex()
         
-        # 防止重放 (内存中)
-        if nonce_hex in self._used_nonces:
-            print(f"⚠️  Nonce already used: {nonce_hex}")
-            return None
-        self._used_nonces.add(nonce_hex)
-        
         # 过期时间 (1小时后)
         deadline = timestamp + 3600
         
-        # NFT 合约地址
-        contract_address = config.NFT_CONTRACT_ADDRESS or "0x0000000000000000000000000000000000000000"
+        # 防止重放 (内存中)
+        if not self._remember_nonce(nonce_raw, deadline, timestamp):
+            log.warning("Nonce already used: %s", nonce_hex)
+            return None
         
-        print(f"  Contract: {contract_address}")
-        print(f"  Signer: {account.address}")
-        
-        # 构建与智能合约兼容的消息哈希
-        # Solidity: keccak256(abi.encodePacked(userAddress, level, nonce, deadline, contractAddress))
-        message_hash = Web3.solidity_keccak(
-            ['address', 'uint256', 'bytes32', 'uint256', 'address'],
-            [
-                Web3.to_checksum_address(wallet_address),
-                level,
-                nonce_raw,
-                deadline,
-                Web3.to_checksum_address(contract_address)
-            ]
-        )
+        log.debug("Contract: %s, signer: %s", self._contract_checksum, account.address)
         
-        # 使用 eth_account 签名 (EIP-191 personal_sign)
-        signable_message = encode_defunct(message_hash)
-        signed = account.sign_message(signable_message)
+        signature = self._sign_mint_message(
+            account, wallet_address, level, nonce_raw, deadline
+        )
         
         result = {
-            "signature": signed.signature.hex(),
+            "signature": signature,
             "nonce": nonce_hex,
             "deadline": deadline,
-            "contract_address": contract_address,
+            "contract_address": self._contract_checksum,
             "signer": account.address,
             "level": level,
             "wallet": wallet_address
         }
         
-        print(f"✅ Signature generated successfully")
-        print(f"  Signature: {result['signature'][:20]}...")
-        print(f"  Nonce: {result['nonce']}")
-        print(f"  Deadline: {result['deadline']}")
+        log.debug("Mint signature generated, nonce %s, deadline %s", nonce_hex, deadline)
         
         return result
     
@@ -161,14 +262,11 @@ class TheJudge:
         2. 验证密码
         3. 如果正确，生成 NFT 铸造签名
         """
-        print(f"\n📝 Submit password request received:")
-        print(f"  Level: {level}")
-        print(f"  Wallet: {wallet_address[:10]}...")
-        print(f"  Password: {password[:3]}...")
+        log.debug("Submit password request: level %s, wallet %s", level, wallet_address)
         
         # 验证关卡
         if level not in LEVELS:
-            print(f"❌ Invalid level: {level}")
+            log.debug("Invalid level: %s", level)
             return SubmitPasswordResponse(
                 success=False,
                 correct=False,
@@ -179,21 +277,21 @@ class TheJudge:
         is_correct = self.verify_password(level, password)
         
         if not is_correct:
-            print(f"❌ Incorrect password")
+            log.debug("Incorrect password for level %s", level)
             return SubmitPasswordResponse(
                 success=True,
                 correct=False,
                 message="❌ Incorrect password. Try again!"
             )
         
-        print(f"✅ Password correct!")
+        log.debug("Password correct for level %s", level)
         
         # 密码正确，生成签名
         level_config = LEVELS[level]
         signature_data = self.generate_mint_signature(level, wallet_address)
         
         if not signature_data:
-            print(f"⚠️  Signature generation failed")
+            log.warning("Signature generation failed for level %s", level)
             return SubmitPasswordResponse(
                 success=True,
                 correct=True,
@@ -205,35 +303,40 @@ class TheJudge:
         kite_contribution = None
         if level >= 6:
             # 获取攻击历史
-            attack_data = self._attack_history.get(wallet_address, {})
-            if attack_data.get("prompt"):
+            attack = self._attack_history.get(wallet_address.lower())
+            if attack is not None and attack.prompt:
                 contribution = self._kite_contributor.package_contribution(
                     wallet_address=wallet_address,
                     level=level,
-                    prompt=attack_data.get("prompt", ""),
-                    response=attack_data.get("response", ""),
+                    prompt=attack.prompt,
+                    response=attack.response,
                     model=config.LLM_MODEL
                 )
-                # 异步提交到 Kite AI
-                kite_result = await self._kite_contributor.submit_to_kite(contribution)
+                # 后台提交到 Kite AI，不阻塞签名返回
+                task = asyncio.create_task(self._kite_contributor.submit_to_kite(contribution))
+                self._pending_kite_tasks.add(task)
+                task.add_done_callback(self._log_kite_result)
                 kite_contribution = {
                     "contribution_id": contribution.contribution_id,
-                    "status": kite_result.get("status", "submitted"),
-                    "estimated_reward": kite_result.get("estimated_reward", {}),
+                    "status": "queued",
+                    "estimated_reward": self._kite_contributor._estimate_reward(level),
                 }
         
         response = SubmitPasswordResponse(
             success=True,
             correct=True,
             message=f"🎉 Congratulations! You've beaten Level {level}! Use the signature to mint your NFT.",
-            mint_signature=json.dumps(signature_data),
+            mint_signature=signature_data,
             nft_metadata=level_config.nft_metadata,
             kite_contribution=kite_contribution
         )
         
-        print(f"📤 Response prepared:")
-        print(f"  - mint_signature: {'✓ Included' if response.mint_signature else '✗ Missing'}")
-        print(f"  - nft_metadata: {response.nft_metadata}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "Response prepared: mint_signature %s, nft_metadata %s",
+                "included" if response.mint_signature else "missing",
+                response.nft_metadata
+            )
         
         return response
 
@@ -261,63 +364,45 @@ class TheJudge:
         """
         account = self._get_signer_account()
         if not account:
-            print(f"❌ No signer account configured - SIGNER_PRIVATE_KEY is missing")
+            log.warning("No signer account configured - SIGNER_PRIVATE_KEY is missing")
             return None
         
-        print(f"🏆 Generating certificate signature for wallet {wallet_address[:10]}...")
-        print(f"   Completed levels: {completed_levels}")
+        log.debug(
+            "Generating certificate signature for wallet %s, completed levels %s",
+            wallet_address, completed_levels
+        )
         
         # 生成 nonce (bytes32)
         timestamp = int(time.time())
-        nonce_raw = hashlib.sha256(
-            f"{wallet_address}:certificate:{timestamp}:{os.urandom(8).hex()}".encode()
-        ).digest()
+        nonce_raw = secrets.token_bytes(32)
         nonce_hex = "0x" + nonce_raw.hex()
         
-        # 防止重放
-        if nonce_hex in self._used_nonces:
-            print(f"⚠️  Nonce already used: {nonce_hex}")
-            return None
-        self._used_nonces.add(nonce_hex)
-        
         # 过期时间 (1小时后)
         deadline = timestamp + 3600
         
-        # NFT 合约地址
-        contract_address = config.NFT_CONTRACT_ADDRESS or "0x0000000000000000000000000000000000000000"
+        # 防止重放
+        if not self._remember_nonce(nonce_raw, deadline, timestamp):
+            log.warning("Nonce already used: %s", nonce_hex)
+            return None
         
         # 勋章等级 (特殊等级 8 表示荣誉勋章)
         certificate_level = 8
         
-        # 构建与智能合约兼容的消息哈希
-        message_hash = Web3.solidity_keccak(
-            ['address', 'uint256', 'bytes32', 'uint256', 'address'],
-            [
-                Web3.to_checksum_address(wallet_address),
-                certificate_level,
-                nonce_raw,
-                deadline,
-                Web3.to_checksum_address(contract_address)
-            ]
+        signature = self._sign_mint_message(
+            account, wallet_address, certificate_level, nonce_raw, deadline
         )
         
-        # 使用 eth_account 签名 (EIP-191 personal_sign)
-        signable_message = encode_defunct(message_hash)
-        signed = account.sign_message(signable_message)
-        
         result = {
-            "signature": signed.signature.hex(),
+            "signature": signature,
             "nonce": nonce_hex,
             "deadline": deadline,
-            "contract_address": contract_address,
+            "contract_address": self._contract_checksum,
             "signer": account.address,
             "level": certificate_level,
             "wallet": wallet_address,
             "certificate_type": "honor_badge"
         }
         
-        print(f"✅ Certificate signature generated successfully")
-        print(f"  Signature: {result['signature'][:20]}...")
-        print(f"  Nonce: {result['nonce']}")
+        log.debug("Certificate signature generated, nonce %s", nonce_hex)
         
         return result
@@ -4,15 +4,24 @@ Kite AI Data Contributor
 """
 import hashlib
 import time
-import json
 import aiohttp
-from typing import Optional, Dict, Any
-from dataclasses import dataclass, asdict
+from collections import defaultdict
+from typing import Optional, Dict, Any, List
+from dataclasses import dataclass, fields
 from eth_account import Account
 from eth_account.messages import encode_defunct
+import jsonutil
 
 
-@dataclass
+# 根据难度等级估算的贡献奖励
+_REWARD_TABLE: Dict[int, Dict[str, Any]] = {
+    6: {"kite_points": 10, "estimated_kite": "0.001"},
+    7: {"kite_points": 50, "estimated_kite": "0.005"},
+}
+_ZERO_REWARD: Dict[str, Any] = {"kite_points": 0, "estimated_kite": "0"}
+
+
+@dataclass(slots=True)
 class JailbreakContribution:
     """越狱数据贡献结构"""
     wallet_address: str      # 贡献者钱包
@@ -23,7 +32,12 @@ class JailbreakContribution:
     timestamp: int           # 时间戳
     contribution_id: str     # 唯一贡献 ID
     signature: str           # 后端签名（防伪造）
-    
+    prompt_hash: str = ""    # Prompt 的 SHA-256 摘要 (hex)，打包时计算一次
+
+
+# 字段均为基础类型，直接按字段名取值即可，无需 asdict 递归拷贝
+_CONTRIB_FIELDS = tuple(f.name for f in fields(JailbreakContribution))
+
 
 class KiteContributor:
     """
@@ -41,9 +55,14 @@ class KiteContributor:
     def __init__(self, signer_private_key: Optional[str] = None):
         self._signer_key = signer_private_key
         self._contributions: list = []  # 本地存储贡献记录
+        # 按钱包 (小写) 增量维护的贡献索引与积分
+        self._by_wallet: Dict[str, List[JailbreakContribution]] = defaultdict(list)
+        self._points_by_wallet: Dict[str, int] = defaultdict(int)
+        self._signer_account = self._build_signer_account()  # 只解析一次私钥
+        self._session: Optional[aiohttp.ClientSession] = None  # 复用的 HTTP 会话，首次提交时创建
         
-    def _get_signer_account(self) -> Optional[Account]:
-        """获取签名账户"""
+    def _build_signer_account(self) -> Optional[Account]:
+        """根据签名私钥构建签名账户"""
         if not self._signer_key:
             return None
         pk = self._signer_key
@@ -51,16 +70,34 @@ class KiteContributor:
             pk = "0x" + pk
         return Account.from_key(pk)
     
+    def _get_signer_account(self) -> Optional[Account]:
+        """获取签名账户"""
+        return self._signer_account
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的 HTTP 会话 (keep-alive 连接池)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=60)
+            )
+        return self._session
+    
+    async def close(self):
+        """关闭 HTTP 会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
     def _generate_contribution_id(
         self, 
         wallet: str, 
         level: int, 
-        prompt: str, 
+        prompt_hash: bytes, 
         timestamp: int
     ) -> str:
         """生成唯一的贡献 ID"""
-        data = f"{wallet}:{level}:{prompt[:50]}:{timestamp}"
-        return hashlib.sha256(data.encode()).hexdigest()[:32]
+        data = f"{wallet}:{level}:{timestamp}:".encode() + prompt_hash[:16]
+        return hashlib.sha256(data).hexdigest()[:32]
     
     def _sign_contribution(self, contribution: JailbreakContribution) -> str:
         """对贡献数据签名"""
@@ -75,7 +112,7 @@ class KiteContributor:
             "level": contribution.level,
             "timestamp": contribution.timestamp,
         }
-        message_str = json.dumps(message_data, sort_keys=True)
+        message_str = jsonutil.dumps(message_data, sort_keys=True)
         signable = encode_defunct(text=message_str)
         signed = account.sign_message(signable)
         
@@ -95,8 +132,9 @@ class KiteContributor:
         只有 Level 6-7 的数据才有足够价值被记录
         """
         timestamp = int(time.time())
+        prompt_digest = hashlib.sha256(prompt.encode()).digest()
         contribution_id = self._generate_contribution_id(
-            wallet_address, level, prompt, timestamp
+            wallet_address, level, prompt_digest, timestamp
         )
         
         contribution = JailbreakContribution(
@@ -107,7 +145,8 @@ class KiteContributor:
             model=model,
             timestamp=timestamp,
             contribution_id=contribution_id,
-            signature=""  # 先创建，后签名
+            signature="",  # 先创建，后签名
+            prompt_hash=prompt_digest.hex()
         )
         
         # 签名
@@ -115,6 +154,10 @@ class KiteContributor:
         
         # 本地记录
         self._contributions.append(contribution)
+        self._by_wallet[contribution.wallet_address].append(contribution)
+        self._points_by_wallet[contribution.wallet_address] += (
+            self._estimate_reward(level).get("kite_points", 0)
+        )
         
         return contribution
     
@@ -134,7 +177,7 @@ class KiteContributor:
             "data": {
                 "contributor": contribution.wallet_address,
                 "level": contribution.level,
-                "prompt_hash": hashlib.sha256(contribution.prompt.encode()).hexdigest(),
+                "prompt_hash": contribution.prompt_hash,
                 "model": contribution.model,
                 "timestamp": contribution.timestamp,
                 "signature": contribution.signature,
@@ -149,24 +192,24 @@ class KiteContributor:
         # 尝试提交到 Kite AI
         # 注意: 实际 API 端点需要查阅 Kite AI 官方文档
         try:
-            async with aiohttp.ClientSession() as session:
-                # 这里使用模拟端点，实际需要替换为真实 API
-                # async with session.post(
-                #     f"{self.KITE_API_BASE}/v1/contributions",
-                #     json=payload,
-                #     headers={"Content-Type": "application/json"}
-                # ) as resp:
-                #     result = await resp.json()
-                #     return result
-                
-                # 模拟返回
-                return {
-                    "success": True,
-                    "contribution_id": contribution.contribution_id,
-                    "status": "pending_verification",
-                    "estimated_reward": self._estimate_reward(contribution.level),
-                    "message": "Contribution submitted successfully. Pending PoAI verification."
-                }
+            session = await self._get_session()
+            # 这里使用模拟端点，实际需要替换为真实 API
+            # async with session.post(
+            #     f"{self.KITE_API_BASE}/v1/contributions",
+            #     json=payload,
+            #     headers={"Content-Type": "application/json"}
+            # ) as resp:
+            #     result = await resp.json()
+            #     return result
+            
+            # 模拟返回
+            return {
+                "success": True,
+                "contribution_id": contribution.contribution_id,
+                "status": "pending_verification",
+                "estimated_reward": self._estimate_reward(contribution.level),
+                "message": "Contribution submitted successfully. Pending PoAI verification."
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -175,28 +218,20 @@ class KiteContributor:
             }
     
     def _estimate_reward(self, level: int) -> Dict[str, Any]:
-        """估算贡献奖励"""
-        # 根据难度等级估算奖励
-        base_reward = {
-            6: {"kite_points": 10, "estimated_kite": "0.001"},
-            7: {"kite_points": 50, "estimated_kite": "0.005"},
-        }
-        return base_reward.get(level, {"kite_points": 0, "estimated_kite": "0"})
+        """估算贡献奖励 (返回共享的只读表项，调用方不要修改)"""
+        return _REWARD_TABLE.get(level, _ZERO_REWARD)
     
     def get_contribution_stats(self, wallet_address: str) -> Dict[str, Any]:
         """获取钱包的贡献统计"""
         wallet = wallet_address.lower()
-        contributions = [c for c in self._contributions if c.wallet_address == wallet]
+        contributions = self._by_wallet.get(wallet, [])
         
         return {
             "total_contributions": len(contributions),
             "levels_contributed": list(set(c.level for c in contributions)),
-            "total_estimated_points": sum(
-                self._estimate_reward(c.level).get("kite_points", 0) 
-                for c in contributions
-            ),
+            "total_estimated_points": self._points_by_wallet.get(wallet, 0),
         }
     
     def get_all_contributions(self) -> list:
         """获取所有贡献记录（用于调试）"""
-        return [asdict(c) for c in self._contributions]
+        return [{f: getattr(c, f) for f in _CONTRIB_FIELDS} for c in self._contributions]
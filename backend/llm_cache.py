@@ -0,0 +1,74 @@
+"""
+LLM Cache - LLM 响应缓存
+对完全相同的请求直接返回缓存结果，省去一次远程 API 往返
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import jsonutil
+
+
+class LLMCache:
+    """
+    带 TTL 的 LRU 缓存
+
+    key 为 (model, payload) 的 SHA256，payload 默认是完整的 messages，
+    调用方也可以传入更粗粒度的请求描述以提高命中率；value 为 LLM 返回的文本
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, payload: Any) -> str:
+        """根据模型和请求描述 (messages 或其他可 JSON 序列化的值) 生成缓存 key"""
+        data = jsonutil.dumps_bytes({"model": model, "payload": payload}, sort_keys=True)
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def lookup(self, model: str, payload: Any) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查询缓存，返回 (key, cached)
+        
+        缓存关闭 (maxsize <= 0) 时返回 (None, None)，之后 store 不做任何事
+        """
+        if self.maxsize <= 0:
+            return None, None
+        key = self.make_key(model, payload)
+        return key, self.get(key)
+    
+    def store(self, key: Optional[str], value: Optional[str]):
+        """未命中时写回 LLM 结果，key 为 None 或结果为空时忽略"""
+        if key is not None and value:
+            self.set(key, value)
+    
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,64 @@
+"""
+LLM Client - 共享的 LLM 客户端
+The Brain 与 The Oracle 共用同一组 AsyncOpenAI 客户端、连接池与并发上限
+"""
+import asyncio
+import os
+from typing import Dict
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from config import config
+
+
+# 按 provider 共享的 AsyncOpenAI 客户端 (复用同一个 HTTP 连接池)
+_clients: Dict[str, AsyncOpenAI] = {}
+# 所有 LLM 请求共享的并发上限，避免突发流量打满 provider 限流
+llm_semaphore = asyncio.Semaphore(config.LLM_MAX_CONCURRENCY)
+
+
+def get_shared_client(provider: str) -> AsyncOpenAI:
+    """获取 provider 对应的共享客户端，首次调用时创建"""
+    client = _clients.get(provider)
+    if client is not None:
+        return client
+    
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100)
+    )
+    if provider == "deepseek":
+        client = AsyncOpenAI(
+            api_key=os.getenv("DEEPSEEK_API_KEY"),
+            base_url="https://api.deepseek.com",
+            http_client=http_client
+        )
+    elif provider == "openrouter":
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            base_url="https://openrouter.ai/api/v1",
+            http_client=http_client
+        )
+    else:
+        # Default to OpenAI
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client
+        )
+    _clients[provider] = client
+    return client
+
+
+async def close_shared_clients():
+    """关闭所有共享客户端，释放连接池 (应用关闭时调用)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+def resolve_model(provider: str) -> str:
+    """provider 对应的模型名，LLM_MODEL 未设置时使用默认模型"""
+    if provider == "deepseek":
+        return config.LLM_MODEL or "deepseek-chat"
+    elif provider == "openrouter":
+        return config.LLM_MODEL or "openai/gpt-4o-mini"
+    return config.LLM_MODEL or "gpt-4o-mini"
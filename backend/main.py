@@ -2,14 +2,15 @@
 Gandalf Game - FastAPI 主应用
 提供 RESTful API 接口
 """
+import hashlib
 import os
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 
 from config import config, LEVELS
 from models import (
@@ -23,6 +24,7 @@ from models import (
 from brain import TheBrain
 from judge import TheJudge
 from oracle import TheOracle
+from llm_client import close_shared_clients
 
 
 # ============== 全局服务实例 ==============
@@ -43,6 +45,9 @@ async def lifespan(app: FastAPI):
     yield
     # 关闭时清理
     print("🧙 Gandalf Game shutting down...")
+    if judge is not None:
+        await judge.close()
+    await close_shared_clients()
 
 
 # ============== FastAPI 应用 ==============
@@ -73,6 +78,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 
@@ -80,8 +86,13 @@ app.add_middleware(
 
 @app.get("/health", tags=["System"])
 async def health_check():
-    """健康检查"""
-    return {"status": "ok", "service": "seedhunter_game"}
+    """健康检查 (附带 LLM 缓存命中统计)"""
+    llm_cache = {}
+    if brain is not None:
+        llm_cache["brain"] = brain.llm.cache.stats()
+    if oracle is not None:
+        llm_cache["oracle"] = oracle.llm.cache.stats()
+    return {"status": "ok", "service": "seedhunter_game", "llm_cache": llm_cache}
 
 
 # ============== Game Status ==============
@@ -167,6 +178,33 @@ async def chat_with_gandalf(request: ChatRequest):
     )
 
 
+@app.post("/api/brain/chat/stream", tags=["The Brain"])
+async def chat_with_gandalf_stream(request: ChatRequest):
+    """
+    与 Gandalf 流式对话
+    
+    参数与 `/api/brain/chat` 相同，AI 回复以纯文本流逐段返回，
+    会话ID 通过 `X-Session-Id` 响应头返回。
+    """
+    if brain is None:
+        raise HTTPException(status_code=503, detail="Brain service not initialized")
+    
+    try:
+        session_id, chunks = brain.start_stream(
+            level=request.level,
+            message=request.message,
+            session_id=request.session_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return StreamingResponse(
+        chunks,
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Session-Id": session_id}
+    )
+
+
 @app.delete("/api/brain/session/{session_id}", tags=["The Brain"])
 async def clear_session(session_id: str):
     """
@@ -251,13 +289,15 @@ async def negotiate_hint_price(request: NegotiateHintRequest):
     # 临时使用固定钱包地址，实际应从请求中获取
     wallet = "0x0000000000000000000000000000000000000000"
     
-    return await oracle.negotiate_hint_price(
+    result = await oracle.negotiate_hint_price(
         level=request.level,
         hint_index=request.hint_index,
         offered_price=request.offered_price,
         wallet_address=wallet,
         message=request.negotiation_message
     )
+    # 结果已是 NegotiateHintResponse，直接由 pydantic-core 序列化，跳过 FastAPI 的再次校验与 dict 转换
+    return Response(content=result.model_dump_json(), media_type="application/json")
 
 
 @app.post("/api/oracle/verify-payment", response_model=HintResponse, tags=["The Oracle"])
@@ -340,7 +380,6 @@ async def claim_certificate(request: ClaimCertificateRequest):
         )
     
     # 生成勋章签名
-    import json
     signature_data = judge.generate_certificate_signature(
         wallet_address=request.wallet_address,
         completed_levels=request.completed_levels
@@ -370,7 +409,7 @@ async def claim_certificate(request: ClaimCertificateRequest):
         success=True,
         eligible=True,
         message="🎉 恭喜！您已完成所有关卡，可以铸造您的荣誉勋章 NFT！",
-        mint_signature=json.dumps(signature_data),
+        mint_signature=signature_data,
         certificate_metadata=certificate_metadata
     )
 
@@ -382,13 +421,28 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(CURRENT_DIR, "static")
 
 
+def _load_index() -> Tuple[Optional[bytes], Optional[str]]:
+    """启动时读取前端 index.html 并计算 ETag"""
+    index_path = os.path.join(STATIC_DIR, "index.html")
+    if not os.path.exists(index_path):
+        return None, None
+    with open(index_path, "rb") as f:
+        content = f.read()
+    return content, '"' + hashlib.sha256(content).hexdigest() + '"'
+
+
+_INDEX_BYTES, _INDEX_ETAG = _load_index()
+
+
 @app.get("/", response_class=HTMLResponse, tags=["Frontend"])
-async def serve_frontend():
+async def serve_frontend(request: Request):
     """服务前端页面"""
-    index_path = os.path.join(STATIC_DIR, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
-    return HTMLResponse(content="<h1>Gandalf Game API</h1><p>Visit /docs for API documentation</p>")
+    if _INDEX_BYTES is None:
+        return HTMLResponse(content="<h1>Gandalf Game API</h1><p>Visit /docs for API documentation</p>")
+    headers = {"ETag": _INDEX_ETAG, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=_INDEX_BYTES, headers=headers)
 
 
 # 挂载静态文件目录
@@ -398,14 +452,24 @@ if os.path.exists(STATIC_DIR):
 
 # ============== 运行入口 ==============
 
-def run_server():
-    """运行服务器"""
+def run_server(app: str = "gandalf_game.main:app"):
+    """运行服务器 (run.py 也通过这里启动，两个入口共用同一套 uvicorn 参数)"""
+    import importlib.util
     import uvicorn
+    # uvloop / httptools 可用时显式启用 (Windows 上无 uvloop，回退到默认实现)
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    has_httptools = importlib.util.find_spec("httptools") is not None
     uvicorn.run(
-        "gandalf_game.main:app",
+        app,
         host=config.HOST,
         port=config.PORT,
-        reload=config.DEBUG
+        reload=config.DEBUG,
+        limit_concurrency=config.LIMIT_CONCURRENCY or None,
+        timeout_keep_alive=config.TIMEOUT_KEEP_ALIVE,
+        loop="uvloop" if has_uvloop else "asyncio",
+        http="httptools" if has_httptools else "h11",
+        log_level="info" if config.DEBUG else "warning",
+        access_log=config.DEBUG
     )
 
 
@@ -1,8 +1,8 @@
 """
 # Seed Hunter Game Models - API 请求/响应数据模型
 """
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from typing import Any
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 
 
@@ -15,15 +15,22 @@ class GuardResult(str, Enum):
 
 # ============== Request Models ==============
 
+# 请求模型拒绝未声明的字段，避免客户端多传的数据被静默丢弃
+_REQUEST_CONFIG = ConfigDict(extra="forbid")
+
 class ChatRequest(BaseModel):
     """聊天请求 - The Brain 模块"""
+    model_config = _REQUEST_CONFIG
+
     level: int = Field(..., ge=1, le=7, description="关卡编号 (1-7)")
     message: str = Field(..., min_length=1, max_length=2000, description="用户消息")
-    session_id: Optional[str] = Field(None, description="会话ID，用于保持对话上下文")
+    session_id: str | None = Field(None, description="会话ID，用于保持对话上下文")
 
 
 class SubmitPasswordRequest(BaseModel):
     """提交密码请求 - The Judge 模块"""
+    model_config = _REQUEST_CONFIG
+
     level: int = Field(..., ge=1, le=7, description="关卡编号 (1-7)")
     password: str = Field(..., min_length=1, max_length=100, description="用户提交的密码猜测")
     wallet_address: str = Field(..., description="用户钱包地址，用于 NFT 铸造")
@@ -31,14 +38,18 @@ class SubmitPasswordRequest(BaseModel):
 
 class NegotiateHintRequest(BaseModel):
     """讨价还价请求 - The Oracle 模块"""
+    model_config = _REQUEST_CONFIG
+
     level: int = Field(..., ge=1, le=7, description="关卡编号 (1-7)")
     hint_index: int = Field(..., ge=0, description="提示索引 (0-based)")
     offered_price: float = Field(..., gt=0, description="用户出价 (USDC)")
-    negotiation_message: Optional[str] = Field(None, description="讨价还价的对话内容")
+    negotiation_message: str | None = Field(None, description="讨价还价的对话内容")
 
 
 class VerifyHintPaymentRequest(BaseModel):
     """验证提示支付请求 - The Oracle 模块"""
+    model_config = _REQUEST_CONFIG
+
     level: int = Field(..., ge=1, le=7, description="关卡编号")
     hint_index: int = Field(..., ge=0, description="提示索引")
     tx_hash: str = Field(..., description="链上交易哈希")
@@ -52,7 +63,7 @@ class ChatResponse(BaseModel):
     success: bool
     message: str = Field(..., description="AI 回复内容")
     blocked: bool = Field(False, description="是否被防护系统拦截")
-    block_reason: Optional[str] = Field(None, description="拦截原因")
+    block_reason: str | None = Field(None, description="拦截原因")
     session_id: str = Field(..., description="会话ID")
 
 
@@ -61,9 +72,9 @@ class SubmitPasswordResponse(BaseModel):
     success: bool
     correct: bool = Field(..., description="密码是否正确")
     message: str
-    mint_signature: Optional[str] = Field(None, description="NFT 铸造签名 (仅正确时返回)")
-    nft_metadata: Optional[Dict[str, Any]] = Field(None, description="NFT 元数据")
-    kite_contribution: Optional[Dict[str, Any]] = Field(None, description="Kite AI 数据贡献信息 (Level 6-7)")
+    mint_signature: dict[str, Any] | None = Field(None, description="NFT 铸造签名数据 (仅正确时返回)")
+    nft_metadata: dict[str, Any] | None = Field(None, description="NFT 元数据")
+    kite_contribution: dict[str, Any] | None = Field(None, description="Kite AI 数据贡献信息 (Level 6-7)")
 
 
 class LevelInfoResponse(BaseModel):
@@ -81,16 +92,16 @@ class NegotiateHintResponse(BaseModel):
     """讨价还价响应"""
     success: bool
     accepted: bool = Field(..., description="AI 是否接受出价")
-    counter_offer: Optional[float] = Field(None, description="AI 的还价")
-    final_price: Optional[float] = Field(None, description="最终成交价格 (仅接受时)")
+    counter_offer: float | None = Field(None, description="AI 的还价")
+    final_price: float | None = Field(None, description="最终成交价格 (仅接受时)")
     ai_message: str = Field(..., description="AI 的讨价还价回复")
-    payment_address: Optional[str] = Field(None, description="支付地址 (仅接受时)")
+    payment_address: str | None = Field(None, description="支付地址 (仅接受时)")
 
 
 class HintResponse(BaseModel):
     """获取提示响应"""
     success: bool
-    hint: Optional[str] = Field(None, description="提示内容")
+    hint: str | None = Field(None, description="提示内容")
     hint_index: int
     remaining_hints: int
     message: str
@@ -98,7 +109,7 @@ class HintResponse(BaseModel):
 
 class GameStatusResponse(BaseModel):
     """游戏状态响应"""
-    levels: List[LevelInfoResponse]
+    levels: list[LevelInfoResponse]
     total_levels: int = 7
 
 
@@ -118,8 +129,10 @@ class HintPaidEvent(BaseModel):
 
 class ClaimCertificateRequest(BaseModel):
     """领取荣誉勋章请求"""
+    model_config = _REQUEST_CONFIG
+
     wallet_address: str = Field(..., description="用户钱包地址")
-    completed_levels: List[int] = Field(..., description="已完成的关卡列表")
+    completed_levels: list[int] = Field(..., description="已完成的关卡列表")
 
 
 class ClaimCertificateResponse(BaseModel):
@@ -127,5 +140,5 @@ class ClaimCertificateResponse(BaseModel):
     success: bool
     eligible: bool = Field(..., description="是否有资格领取勋章")
     message: str
-    mint_signature: Optional[str] = Field(None, description="NFT 铸造签名")
-    certificate_metadata: Optional[Dict[str, Any]] = Field(None, description="勋章元数据")
+    mint_signature: dict[str, Any] | None = Field(None, description="NFT 铸造签名数据")
+    certificate_metadata: dict[str, Any] | None = Field(None, description="勋章元数据")
@@ -3,67 +3,168 @@ The Oracle - 提示监听与讨价还价模块
 负责监听链上支付事件、发放提示、与用户讨价还价
 """
 import asyncio
-import json
-import os
-from typing import Dict, Optional, List, Any
-from openai import AsyncOpenAI
+from dataclasses import dataclass, field
+from typing import Any
+from cachetools import TTLCache
+import jsonutil
 from config import config, LEVELS
+from llm_cache import LLMCache
+from llm_client import get_shared_client, llm_semaphore, resolve_model
 from models import (
     NegotiateHintResponse,
-    HintResponse,
-    HintPaidEvent
+    HintResponse
 )
 
 
+# 以下表格只依赖静态的 LEVELS 配置，在导入时一次性生成
+# 每关的提示内容与数量
+_HINTS: dict[int, tuple[str, ...]] = {level: tuple(c.hints) for level, c in LEVELS.items()}
+_HINT_COUNTS: dict[int, int] = {level: len(hints) for level, hints in _HINTS.items()}
+
+
+# {(level, hint_index): price}
+_PriceTable = dict[tuple[int, int], float]
+
+
+def _build_price_tables() -> tuple[_PriceTable, _PriceTable, _PriceTable]:
+    """生成价格表: 基础价、最低价、出价过低时的固定还价"""
+    base_prices, min_prices, reject_counters = {}, {}, {}
+    for level, level_config in LEVELS.items():
+        for i in range(_HINT_COUNTS[level]):
+            # 后面的提示更贵
+            base_price = level_config.hint_base_price * (1 + i * 0.5)
+            min_price = max(base_price * (1 - config.MAX_HINT_DISCOUNT), config.MIN_HINT_PRICE)
+            base_prices[(level, i)] = base_price
+            min_prices[(level, i)] = min_price
+            reject_counters[(level, i)] = round(min_price + (base_price - min_price) * 0.3, 4)
+    return base_prices, min_prices, reject_counters
+
+
+_BASE_PRICE, _MIN_PRICE, _REJECT_COUNTER = _build_price_tables()
+
+
+def _build_level_hints_info(level: int) -> dict[str, Any]:
+    """生成关卡的提示信息"""
+    hint_count = _HINT_COUNTS[level]
+    return {
+        "level": level,
+        "total_hints": hint_count,
+        "hints": [
+            {"index": i, "price": _BASE_PRICE[(level, i)], "negotiable": True}
+            for i in range(hint_count)
+        ]
+    }
+
+
+# 每关的提示信息 (get_level_hints_info 直接返回，调用方不应修改)
+_HINTS_INFO: dict[int, dict[str, Any]] = {level: _build_level_hints_info(level) for level in LEVELS}
+
+# 讨价还价缓存的轮次桶数：第 1、2 轮各自一桶，第 3 轮及以后共用一桶
+_CACHE_ROUND_BUCKETS = 3
+
+# 讨价还价 prompt 模板 (模块级常量，请求时只填入动态字段)
+_NEG_TEMPLATE = """You are a shrewd merchant selling hints for a puzzle game.
+
+Base price: {base_price} USDC
+Minimum acceptable: {min_price} USDC
+Customer's offer: {offered_price} USDC
+Negotiation round: {rounds}
+Customer's message: "{message}"
+
+Decide whether to:
+1. ACCEPT the offer (if it's reasonable or customer is persuasive)
+2. COUNTER with a lower price (between their offer and base price)
+3. REJECT and insist on a higher price
+
+Respond in JSON format:
+{{"decision": "ACCEPT/COUNTER/REJECT", "price": <number or null>, "message": "<your response to customer>"}}
+
+Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
+
+
+def _parse_json_object(text: str | None) -> dict[str, Any] | None:
+    """取第一个 '{' 到最后一个 '}' 之间的内容解析为 JSON 对象，失败返回 None"""
+    if not text:
+        return None
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        result = jsonutil.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return result if isinstance(result, dict) else None
+
+
 class SimpleLLM:
     """简单的 LLM 封装"""
     
     def __init__(self):
         provider = config.LLM_PROVIDER.lower()
+        # 与 The Brain 共享同一个客户端和连接池
+        self.client = get_shared_client(provider)
+        self.model = resolve_model(provider)
         
-        if provider == "deepseek":
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("DEEPSEEK_API_KEY"),
-                base_url="https://api.deepseek.com"
-            )
-            self.model = config.LLM_MODEL or "deepseek-chat"
-        elif provider == "openrouter":
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("OPENROUTER_API_KEY"),
-                base_url="https://openrouter.ai/api/v1"
-            )
-            self.model = config.LLM_MODEL or "openai/gpt-4o-mini"
-        else:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-            self.model = config.LLM_MODEL or "gpt-4o-mini"
+        # 讨价还价缓存与 The Brain 的对话缓存分开配置
+        self.cache = LLMCache(maxsize=config.NEGOTIATION_CACHE_SIZE, ttl=config.LLM_CACHE_TTL)
     
-    async def aask(self, prompt: str, system_msg: str = None) -> str:
+    def _build_messages(self, prompt: str, system_msg: str = None) -> list[dict]:
         messages = []
         if system_msg:
             messages.append({"role": "system", "content": system_msg})
         messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    async def aask_json(
+        self,
+        prompt: str,
+        system_msg: str = None,
+        cache_key_parts: dict[str, Any] | None = None
+    ) -> dict[str, Any] | None:
+        """
+        以 JSON 模式调用 LLM 并解析回复
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=512
+        cache_key_parts 不为空时按它而不是完整 prompt 命中缓存；
+        无法解析时返回 None，且不写入缓存，避免同一请求在 TTL 内一直拿到坏结果
+        """
+        messages = self._build_messages(prompt, system_msg)
+        cache_key, cached = self.cache.lookup(
+            self.model, cache_key_parts if cache_key_parts is not None else messages
         )
-        return response.choices[0].message.content
+        if cached is not None:
+            return _parse_json_object(cached)
+        
+        # 与 The Brain 共用并发上限
+        async with llm_semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=512,
+                # JSON 模式下模型只返回 JSON 对象 (prompt 中需包含 "JSON" 字样)
+                response_format={"type": "json_object"}
+            )
+        content = response.choices[0].message.content
+        result = _parse_json_object(content)
+        if result is not None:
+            self.cache.store(cache_key, content)
+        return result
 
 
+@dataclass(slots=True)
 class NegotiationSession:
     """讨价还价会话"""
-    def __init__(self, level: int, hint_index: int, base_price: float):
-        self.level = level
-        self.hint_index = hint_index
-        self.base_price = base_price
-        self.min_price = base_price * (1 - config.MAX_HINT_DISCOUNT)
-        self.current_offer: Optional[float] = None
-        self.rounds: int = 0
-        self.accepted: bool = False
-        self.final_price: Optional[float] = None
+    level: int
+    hint_index: int
+    base_price: float
+    min_price: float = field(init=False)
+    current_offer: float | None = None
+    rounds: int = 0
+    accepted: bool = False
+    final_price: float | None = None
+
+    def __post_init__(self):
+        self.min_price = self.base_price * (1 - config.MAX_HINT_DISCOUNT)
 
 
 class TheOracle:
@@ -79,29 +180,25 @@ class TheOracle:
     
     def __init__(self):
         self.llm = SimpleLLM()
-        # 已解锁的提示: {(level, hint_index, wallet_address): True}
-        self._unlocked_hints: Dict[tuple, bool] = {}
-        # 进行中的讨价还价: {session_key: NegotiationSession}
-        self._negotiations: Dict[str, NegotiationSession] = {}
-        # 待验证的支付: {tx_hash: HintPaidEvent}
-        self._pending_payments: Dict[str, Dict] = {}
+        # 已解锁的提示: {(level, hint_index, wallet_address)}
+        self._unlocked_hints: set[tuple[int, int, str]] = set()
+        # 进行中的讨价还价: {(level, hint_index, wallet_address): NegotiationSession}
+        # 有上限且会过期，避免恶意刷新钱包地址把内存撑爆
+        self._negotiations: "TTLCache[tuple[int, int, str], NegotiationSession]" = TTLCache(
+            maxsize=config.MAX_NEGOTIATIONS, ttl=config.NEGOTIATION_TTL
+        )
     
-    def _get_negotiation_key(self, level: int, hint_index: int, wallet: str) -> str:
-        return f"{level}:{hint_index}:{wallet.lower()}"
+    def _get_negotiation_key(self, level: int, hint_index: int, wallet: str) -> tuple[int, int, str]:
+        # 与 _unlocked_hints 相同的 tuple key，省去每次的字符串拼接
+        return (level, hint_index, wallet.lower())
     
     def get_hint_price(self, level: int, hint_index: int) -> float:
         """获取提示的基础价格"""
-        if level not in LEVELS:
-            return 0.0
-        level_config = LEVELS[level]
-        # 后面的提示更贵
-        return level_config.hint_base_price * (1 + hint_index * 0.5)
+        return _BASE_PRICE.get((level, hint_index), 0.0)
     
     def get_hint_count(self, level: int) -> int:
         """获取关卡的提示数量"""
-        if level not in LEVELS:
-            return 0
-        return len(LEVELS[level].hints)
+        return _HINT_COUNTS.get(level, 0)
     
     async def negotiate_hint_price(
         self,
@@ -109,48 +206,33 @@ class TheOracle:
         hint_index: int,
         offered_price: float,
         wallet_address: str,
-        message: Optional[str] = None
+        message: str | None = None
     ) -> NegotiateHintResponse:
         """
         与用户讨价还价
         
         AI 会根据出价和对话内容决定是否接受
         """
-        if level not in LEVELS:
+        hint_count = _HINT_COUNTS.get(level)
+        if hint_count is None:
             return NegotiateHintResponse(
                 success=False,
                 accepted=False,
                 ai_message="Invalid level."
             )
         
-        level_config = LEVELS[level]
-        if hint_index >= len(level_config.hints):
+        if hint_index >= hint_count:
             return NegotiateHintResponse(
                 success=False,
                 accepted=False,
                 ai_message="Invalid hint index."
             )
         
-        base_price = self.get_hint_price(level, hint_index)
-        min_price = max(base_price * (1 - config.MAX_HINT_DISCOUNT), config.MIN_HINT_PRICE)
+        base_price = _BASE_PRICE[(level, hint_index)]
+        min_price = _MIN_PRICE[(level, hint_index)]
         
-        # 获取或创建讨价还价会话
-        session_key = self._get_negotiation_key(level, hint_index, wallet_address)
-        if session_key not in self._negotiations:
-            self._negotiations[session_key] = NegotiationSession(
-                level=level,
-                hint_index=hint_index,
-                base_price=base_price
-            )
-        
-        session = self._negotiations[session_key]
-        session.rounds += 1
-        session.current_offer = offered_price
-        
-        # 如果出价高于或等于基础价格，直接接受
+        # 出价高于或等于基础价格，直接接受 (无需创建会话)
         if offered_price >= base_price:
-            session.accepted = True
-            session.final_price = offered_price
             return NegotiateHintResponse(
                 success=True,
                 accepted=True,
@@ -159,9 +241,9 @@ class TheOracle:
                 payment_address=config.HINT_CONTRACT_ADDRESS or "0x_CONTRACT_ADDRESS_HERE"
             )
         
-        # 如果出价低于最低价，拒绝
+        # 出价低于最低价，拒绝并给出固定还价 (无需创建会话)
         if offered_price < min_price:
-            counter = round(min_price + (base_price - min_price) * 0.3, 4)
+            counter = _REJECT_COUNTER[(level, hint_index)]
             return NegotiateHintResponse(
                 success=True,
                 accepted=False,
@@ -169,33 +251,44 @@ class TheOracle:
                 ai_message=f"That's too low! I can't go below {min_price} USDC. How about {counter} USDC?"
             )
         
+        # 只有需要 LLM 决定的中间价位才获取或创建讨价还价会话
+        session_key = self._get_negotiation_key(level, hint_index, wallet_address)
+        session = self._negotiations.get(session_key)
+        if session is None:
+            session = NegotiationSession(
+                level=level,
+                hint_index=hint_index,
+                base_price=base_price
+            )
+            self._negotiations[session_key] = session
+        session.rounds += 1
+        session.current_offer = offered_price
+        
         # 中间价格，用 LLM 决定
-        negotiation_prompt = f"""You are a shrewd merchant selling hints for a puzzle game.
-
-Base price: {base_price} USDC
-Minimum acceptable: {min_price} USDC
-Customer's offer: {offered_price} USDC
-Negotiation round: {session.rounds}
-Customer's message: "{message or 'No message'}"
-
-Decide whether to:
-1. ACCEPT the offer (if it's reasonable or customer is persuasive)
-2. COUNTER with a lower price (between their offer and base price)
-3. REJECT and insist on a higher price
-
-Respond in JSON format:
-{{"decision": "ACCEPT/COUNTER/REJECT", "price": <number or null>, "message": "<your response to customer>"}}
-
-Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
+        # 规整空白，让只差空格/换行的重复话术命中缓存
+        normalized_message = " ".join(message.split()) if message else ""
+        negotiation_prompt = _NEG_TEMPLATE.format(
+            base_price=base_price,
+            min_price=min_price,
+            offered_price=offered_price,
+            rounds=session.rounds,
+            message=normalized_message or "No message"
+        )
 
         try:
-            response = await self.llm.aask(negotiation_prompt)
-            # 解析 JSON 响应
-            # 尝试提取 JSON
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
+            # 缓存按局面而不是完整 prompt 命中：prompt 里的轮次每次递增，
+            # 用 prompt 做 key 几乎不会重复，因此轮次按 _CACHE_ROUND_BUCKETS 分桶
+            result = await self.llm.aask_json(
+                negotiation_prompt,
+                cache_key_parts={
+                    "level": level,
+                    "hint_index": hint_index,
+                    "offered_price": offered_price,
+                    "message": normalized_message,
+                    "round_bucket": min(session.rounds, _CACHE_ROUND_BUCKETS),
+                }
+            )
+            if result is not None:
                 decision = result.get("decision", "REJECT").upper()
                 price = result.get("price")
                 ai_msg = result.get("message", "Let me think about it...")
@@ -237,6 +330,17 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
             ai_message=f"Hmm, how about we meet in the middle at {counter} USDC?"
         )
     
+    async def negotiate_hint_price_batch(
+        self,
+        requests: list[dict[str, Any]]
+    ) -> list[NegotiateHintResponse]:
+        """
+        并发处理多个讨价还价请求
+        
+        每项参数与 negotiate_hint_price 相同，LLM 并发受共享信号量限制
+        """
+        return await asyncio.gather(*[self.negotiate_hint_price(**r) for r in requests])
+    
     async def verify_payment_and_unlock(
         self,
         level: int,
@@ -250,7 +354,8 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
         注意: 实际生产环境需要真正验证链上交易
         这里简化处理，模拟验证成功
         """
-        if level not in LEVELS:
+        hint_count = _HINT_COUNTS.get(level)
+        if hint_count is None:
             return HintResponse(
                 success=False,
                 hint_index=hint_index,
@@ -258,8 +363,7 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
                 message="Invalid level."
             )
         
-        level_config = LEVELS[level]
-        if hint_index >= len(level_config.hints):
+        if hint_index >= hint_count:
             return HintResponse(
                 success=False,
                 hint_index=hint_index,
@@ -277,10 +381,10 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
         
         # 标记提示为已解锁
         unlock_key = (level, hint_index, wallet_address.lower())
-        self._unlocked_hints[unlock_key] = True
+        self._unlocked_hints.add(unlock_key)
         
-        hint_text = level_config.hints[hint_index]
-        remaining = len(level_config.hints) - hint_index - 1
+        hint_text = _HINTS[level][hint_index]
+        remaining = hint_count - hint_index - 1
         
         return HintResponse(
             success=True,
@@ -299,7 +403,8 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
         """获取已解锁的提示"""
         unlock_key = (level, hint_index, wallet_address.lower())
         
-        if level not in LEVELS:
+        hint_count = _HINT_COUNTS.get(level)
+        if hint_count is None:
             return HintResponse(
                 success=False,
                 hint_index=hint_index,
@@ -307,18 +412,16 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
                 message="Invalid level."
             )
         
-        level_config = LEVELS[level]
-        
         if unlock_key not in self._unlocked_hints:
             return HintResponse(
                 success=False,
                 hint_index=hint_index,
-                remaining_hints=len(level_config.hints) - hint_index,
+                remaining_hints=hint_count - hint_index,
                 message="Hint not unlocked. Please pay first."
             )
         
-        hint_text = level_config.hints[hint_index]
-        remaining = len(level_config.hints) - hint_index - 1
+        hint_text = _HINTS[level][hint_index]
+        remaining = hint_count - hint_index - 1
         
         return HintResponse(
             success=True,
@@ -328,22 +431,9 @@ Be playful and in-character as a mysterious oracle. Maximum 2 sentences."""
             message="Here's your hint."
         )
     
-    def get_level_hints_info(self, level: int) -> Dict[str, Any]:
-        """获取关卡的提示信息"""
-        if level not in LEVELS:
+    def get_level_hints_info(self, level: int) -> dict[str, Any]:
+        """获取关卡的提示信息 (启动时已生成，调用方不应修改返回值)"""
+        info = _HINTS_INFO.get(level)
+        if info is None:
             return {"error": "Invalid level"}
-        
-        level_config = LEVELS[level]
-        hints_info = []
-        for i in range(len(level_config.hints)):
-            hints_info.append({
-                "index": i,
-                "price": self.get_hint_price(level, i),
-                "negotiable": True
-            })
-        
-        return {
-            "level": level,
-            "total_hints": len(level_config.hints),
-            "hints": hints_info
-        }
+        return info
@@ -2,8 +2,8 @@
 """
 # Seed Hunter Game - 启动脚本
 """
-import uvicorn
 from seedhunter_game.config import config
+from seedhunter_game.main import run_server
 
 if __name__ == "__main__":
     print("🧙 Starting Gandalf Game Server...")
@@ -16,9 +16,4 @@ if __name__ == "__main__":
     print("🎮 Frontend: http://localhost:8000/")
     print()
     
-    uvicorn.run(
-        "seedhunter_game.main:app",
-        host=config.HOST,
-        port=config.PORT,
-        reload=config.DEBUG
-    )
+    run_server("seedhunter_game.main:app")